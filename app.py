@@ -7,13 +7,39 @@ pip install google-genai streamlit PyPDF2
 """
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import PyPDF2
+try:
+    import fitz  # PyMuPDF: MuPDF's C extraction, ~10x faster than PyPDF2
+except ImportError:
+    fitz = None
+try:
+    from rapidfuzz import fuzz, process as rf_process  # near-duplicate matching
+except ImportError:
+    fuzz = None
+try:
+    import orjson  # C-backed JSON, several times faster than stdlib
+except ImportError:
+    orjson = None
+try:
+    import numba  # JIT for the chunk-boundary kernel
+except ImportError:
+    numba = None
+import numpy as np
+import asyncio
+import io
 import json
+import queue
 import re
+import threading
 from datetime import datetime
-import time
-from typing import List, Dict
+from typing import List, Dict, Tuple
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+import httpx
 from google import genai
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
 
 # ============================================================
 # PAGE CONFIGURATION
@@ -85,16 +111,65 @@ st.markdown("""
 # GEMINI API FUNCTIONS (NEW SDK)
 # ============================================================
 
+# Free-tier Gemini is rate-limited per minute, so chunk requests run
+# concurrently but capped by a semaphore + token-bucket limiter
+MAX_CONCURRENCY = 4
+REQUESTS_PER_MINUTE = 10
+
+# Target input size per batched request; beyond this latency starts to
+# outweigh the savings from amortizing the instruction prefix
+BATCH_TOKEN_BUDGET = 6000
+
+# Output-side budget: flash models stop generating at 8192 tokens, and
+# a truncated JSON array costs the whole batch. A question plus a 2-4
+# sentence answer with JSON framing runs ~250 tokens.
+MAX_OUTPUT_TOKENS = 8192
+OUTPUT_TOKENS_PER_FAQ = 250
+
+# Passed through to the underlying httpx clients: HTTP/2 multiplexes
+# concurrent batch requests over one pooled TLS connection instead of
+# paying handshake overhead per call
+_HTTPX_CLIENT_ARGS = {
+    "http2": True,
+    "limits": httpx.Limits(max_connections=32),
+}
+
 @st.cache_resource
 def initialize_gemini_client(api_key: str):
-    """Initialize Gemini client with the NEW SDK"""
+    """Initialize Gemini client with the NEW SDK
+
+    cache_resource keeps one client per key across reruns, so the pooled
+    connections below stay warm for the whole session.
+    """
     try:
-        client = genai.Client(api_key=api_key)
+        client = genai.Client(
+            api_key=api_key,
+            http_options=genai_types.HttpOptions(
+                client_args=_HTTPX_CLIENT_ARGS,
+                async_client_args=_HTTPX_CLIENT_ARGS,
+            )
+        )
         return client
     except Exception as e:
         st.error(f"❌ Failed to initialize Gemini: {e}")
         return None
 
+@st.cache_resource
+def _get_async_loop() -> Tuple[asyncio.AbstractEventLoop, threading.Thread]:
+    """One persistent event loop on a daemon thread for async API calls
+
+    The cached client's pooled connections bind to the loop they were
+    opened on; asyncio.run would close its loop after every button
+    click and strand the warm pool, breaking the next run. All
+    generation coroutines are submitted to this loop instead. The
+    thread is returned so callers can attach the current script-run
+    context before submitting work.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    return loop, thread
+
 def test_gemini_connection(client, model_name: str = "gemini-2.0-flash-exp") -> bool:
     """Test if Gemini API is working"""
     try:
@@ -107,21 +182,68 @@ def test_gemini_connection(client, model_name: str = "gemini-2.0-flash-exp") ->
         st.error(f"❌ Connection test failed: {str(e)[:200]}")
         return False
 
-def generate_with_gemini(client, prompt: str, model_name: str = "gemini-2.0-flash-exp") -> str:
+# JSON-mode schema for batched FAQ responses: the model is constrained
+# to emit a parseable array, so no retry round-trips on malformed output
+_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "chunk_id": {"type": "integer"},
+            "faqs": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "question": {"type": "string"},
+                        "answer": {"type": "string"}
+                    },
+                    "required": ["question", "answer"]
+                }
+            }
+        },
+        "required": ["chunk_id", "faqs"]
+    }
+}
+
+# Rate-limit and transient server errors are worth retrying; anything
+# else (bad key, invalid request) fails immediately
+_RETRYABLE_CODES = {429, 500, 503}
+
+def _is_retryable(exc: BaseException) -> bool:
+    return isinstance(exc, genai_errors.APIError) and exc.code in _RETRYABLE_CODES
+
+@retry(
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception(_is_retryable),
+    reraise=True,
+)
+async def _generate_content_with_retry(client, prompt: str, model_name: str, max_output_tokens: int):
+    return await client.aio.models.generate_content(
+        model=model_name,
+        contents=prompt,
+        config={
+            "temperature": 0.7,
+            "max_output_tokens": max_output_tokens,
+            "top_p": 0.95,
+            "response_mime_type": "application/json",
+            "response_schema": _RESPONSE_SCHEMA,
+        }
+    )
+
+async def generate_with_gemini(
+    client,
+    prompt: str,
+    model_name: str = "gemini-2.0-flash-exp",
+    max_output_tokens: int = 2500
+) -> str:
     """
-    Generate content using the NEW Gemini API
+    Generate content using the NEW Gemini API (async client)
     """
     try:
-        response = client.models.generate_content(
-            model=model_name,
-            contents=prompt,
-            config={
-                "temperature": 0.7,
-                "max_output_tokens": 2500,
-                "top_p": 0.95,
-            }
-        )
-        
+        response = await _generate_content_with_retry(client, prompt, model_name, max_output_tokens)
+
         if response.text:
             return response.text
         else:
@@ -135,215 +257,477 @@ def generate_with_gemini(client, prompt: str, model_name: str = "gemini-2.0-flas
 # TEXT EXTRACTION FUNCTIONS
 # ============================================================
 
-def extract_text_from_pdf(file) -> str:
-    """Extract text from PDF file"""
+def extract_text_from_pdf(file_bytes: bytes) -> str:
+    """Extract text from PDF bytes (PyMuPDF, with PyPDF2 fallback)"""
+    if fitz is None:
+        return _extract_text_pypdf2(file_bytes)
+
     try:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        total_pages = len(pdf_reader.pages)
-        
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        for i, page in enumerate(pdf_reader.pages):
+        doc = fitz.open(stream=file_bytes, filetype="pdf")
+        return "\n\n".join(page.get_text("text") for page in doc).strip()
+
+    except Exception as e:
+        st.error(f"❌ Error reading PDF: {e}")
+        return ""
+
+def _extract_text_pypdf2(file_bytes: bytes) -> str:
+    """Extract text from PDF bytes with PyPDF2"""
+    try:
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+        parts = []
+
+        for page in pdf_reader.pages:
             page_text = page.extract_text()
             if page_text:
-                text += page_text + "\n\n"
-            
-            progress_bar.progress((i + 1) / total_pages)
-            status_text.markdown(f"<p class='progress-text'>📖 Reading page {i+1}/{total_pages}...</p>", 
-                               unsafe_allow_html=True)
-        
-        progress_bar.empty()
-        status_text.empty()
-        
-        return text.strip()
-        
+                parts.append(page_text)
+                parts.append("\n\n")
+
+        return "".join(parts).strip()
+
     except Exception as e:
         st.error(f"❌ Error reading PDF: {e}")
         return ""
 
-def extract_text_from_txt(file) -> str:
-    """Extract text from TXT/MD file"""
+def extract_text_from_txt(file_bytes: bytes) -> str:
+    """Extract text from TXT/MD bytes"""
     try:
-        text = file.read().decode('utf-8', errors='ignore')
-        return text.strip()
+        return file_bytes.decode('utf-8', errors='ignore').strip()
     except Exception as e:
         st.error(f"❌ Error reading text file: {e}")
         return ""
 
+# Compiled once at import; these run on every processed file
+_WS = re.compile(r'\s+')
+# URL / email / bare-page-number removals fused into one alternation so
+# large documents are walked once instead of once per pattern
+_CLEAN = re.compile(r'(https?://\S+)|(\S+@\S+)|(\n\s*\d+\s*\n)')
+
+def _clean_sub(m: re.Match) -> str:
+    return '\n' if m.group(3) else ''
+
 def clean_text(text: str) -> str:
     """Clean and normalize text"""
-    text = re.sub(r'\s+', ' ', text)
-    text = re.sub(r'http[s]?://\S+', '', text)
-    text = re.sub(r'\S+@\S+', '', text)
-    text = re.sub(r'\n\s*\d+\s*\n', '\n', text)
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = _CLEAN.sub(_clean_sub, text)
+    text = _WS.sub(' ', text)
     return text.strip()
 
+@st.cache_data(show_spinner=False)
+def extract_and_clean(file_bytes: bytes, name: str) -> str:
+    """Extract and clean document text, cached on file content
+
+    Re-running with different chunk/question settings on the same upload
+    skips extraction entirely; Streamlit hashes the raw bytes.
+    """
+    if name.endswith('.pdf'):
+        text = extract_text_from_pdf(file_bytes)
+    else:
+        text = extract_text_from_txt(file_bytes)
+    return clean_text(text) if text else ""
+
 # ============================================================
 # TEXT CHUNKING FUNCTIONS
 # ============================================================
 
-def smart_chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[str]:
-    """Split text into chunks with smart boundary detection"""
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    chunks = []
-    current_chunk = []
+_SENT = re.compile(r'(?<=[.!?])\s+')
+
+# Words under-count tokens for code/URLs and over-count for prose;
+# 1.3 is a safe middle ground for the cheap boundary estimate
+_TOKENS_PER_WORD = 1.3
+
+def _chunk_boundaries_impl(sent_lens: np.ndarray, chunk_size: int, overlap: int) -> np.ndarray:
+    """Integer-only boundary kernel: (start, end) sentence ranges per chunk"""
+    n = sent_lens.shape[0]
+    bounds = np.empty((n, 2), dtype=np.int64)
+    count = 0
+    start = 0
     current_length = 0
-    
-    for sentence in sentences:
-        sentence_words = sentence.split()
-        sentence_length = len(sentence_words)
-        
-        if current_length + sentence_length > chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            
-            overlap_sentences = []
+
+    for idx in range(n):
+        sentence_length = sent_lens[idx]
+
+        if current_length + sentence_length > chunk_size and idx > start:
+            bounds[count, 0] = start
+            bounds[count, 1] = idx
+            count += 1
+
             overlap_length = 0
-            
-            for s in reversed(current_chunk):
-                s_length = len(s.split())
-                if overlap_length + s_length > overlap:
-                    break
-                overlap_sentences.insert(0, s)
-                overlap_length += s_length
-            
-            current_chunk = overlap_sentences
+            new_start = idx
+            while new_start > start and overlap_length + sent_lens[new_start - 1] <= overlap:
+                new_start -= 1
+                overlap_length += sent_lens[new_start]
+
+            start = new_start
             current_length = overlap_length
-        
-        current_chunk.append(sentence)
+
         current_length += sentence_length
-    
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-    
-    return chunks
+
+    bounds[count, 0] = start
+    bounds[count, 1] = n
+    count += 1
+
+    return bounds[:count]
+
+if numba is not None:
+    _chunk_boundaries = numba.njit(cache=True)(_chunk_boundaries_impl)
+else:
+    _chunk_boundaries = _chunk_boundaries_impl
+
+def smart_chunk_text(
+    text: str,
+    chunk_size: int = 1500,
+    overlap: int = 200,
+    client=None,
+    model_name: str = None
+) -> Tuple[List[str], List[int]]:
+    """Split text into chunks with smart boundary detection
+
+    Returns the chunks plus each chunk's size. With a client, sizes are
+    Gemini token budgets: boundaries are walked on the word-based
+    estimate (which over-counts, so chunks land under budget) and each
+    finished chunk is measured with count_tokens exactly once — the
+    measurements are returned so batch planning can reuse them instead
+    of re-counting the same text. Without a client, sizes are plain
+    word counts.
+    """
+    sentences = _SENT.split(text)
+    # Per-sentence lengths computed once up front; neither mode makes
+    # API calls during the walk, so both run through the (optionally
+    # JIT-compiled) boundary kernel
+    if client is not None:
+        sent_lens = np.asarray(
+            [max(1, int(len(s.split()) * _TOKENS_PER_WORD)) for s in sentences],
+            dtype=np.int64
+        )
+    else:
+        sent_lens = np.asarray([len(s.split()) for s in sentences], dtype=np.int64)
+
+    bounds = _chunk_boundaries(sent_lens, chunk_size, overlap)
+    chunks = [' '.join(sentences[s:e]) for s, e in bounds]
+
+    if client is not None:
+        # One count_tokens call per chunk, at the flush points the
+        # kernel computed
+        sizes = [_count_tokens(client, chunk, model_name) for chunk in chunks]
+    else:
+        sizes = [int(sent_lens[s:e].sum()) for s, e in bounds]
+
+    return chunks, sizes
 
 # ============================================================
 # FAQ GENERATION FUNCTIONS
 # ============================================================
 
-def generate_faqs_from_chunk(
+# Greedy match grabs the outermost JSON array in a model response
+_JSON_ARRAY_RE = re.compile(r'\[\s*\{.*\}\s*\]', re.DOTALL)
+
+def _json_loads(text: str):
+    """Parse JSON with orjson when available (stdlib fallback)"""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def _json_dumps(data) -> str:
+    """Serialize to indented JSON with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+def _count_tokens(client, text: str, model_name: str) -> int:
+    """Count tokens via the API, falling back to a word-based estimate"""
+    try:
+        return client.models.count_tokens(model=model_name, contents=text).total_tokens
+    except Exception:
+        return int(len(text.split()) * 1.3)
+
+def plan_chunk_batches(
     client,
-    chunk: str,
-    chunk_num: int,
-    total_chunks: int,
+    chunks: List[str],
+    model_name: str,
     num_questions: int = 5,
-    model_name: str = "gemini-2.0-flash-exp"
-) -> List[Dict[str, str]]:
-    """Generate FAQ pairs from a text chunk using Gemini"""
-    
-    prompt = f"""You are an expert at creating educational FAQ content.
+    chunk_tokens: List[int] = None
+) -> List[List[int]]:
+    """Pack consecutive chunks into batches under the input token budget
 
-Generate exactly {num_questions} high-quality question-answer pairs from the following text (chunk {chunk_num}/{total_chunks}).
+    Batch size is also capped so the projected output — num_questions
+    Q/A pairs per chunk — fits under the model's generation limit;
+    otherwise JSON mode truncates mid-array and the batch is lost.
+    chunk_tokens takes the sizes smart_chunk_text already measured;
+    without it each chunk costs one count_tokens call here.
+    """
+    budget = BATCH_TOKEN_BUDGET - _prompt_prefix_tokens(client, model_name)
+    max_chunks = max(1, MAX_OUTPUT_TOKENS // (num_questions * OUTPUT_TOKENS_PER_FAQ))
+
+    batches = []
+    current = []
+    current_tokens = 0
+
+    for i, chunk in enumerate(chunks):
+        if chunk_tokens is not None:
+            n_tokens = chunk_tokens[i]
+        else:
+            n_tokens = _count_tokens(client, chunk, model_name)
+
+        if current and (current_tokens + n_tokens > budget or len(current) >= max_chunks):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+
+        current.append(i)
+        current_tokens += n_tokens
 
-TEXT:
-\"\"\"
-{chunk}
-\"\"\"
+    if current:
+        batches.append(current)
+
+    return batches
+
+# Static instruction block built once; only the per-batch pieces are
+# interpolated, and the prefix can be token-counted for budget planning
+_PROMPT_TEMPLATE = """You are an expert at creating educational FAQ content.
+
+For each of the following {k} texts, generate exactly {num_questions} high-quality question-answer pairs (batch {batch_num}/{total_batches}).
+
+{sections}
 
 REQUIREMENTS:
-1. Generate EXACTLY {num_questions} question-answer pairs
+1. Generate EXACTLY {num_questions} question-answer pairs per text
 2. Questions should be natural and specific to the content
 3. Answers must be complete and informative (2-4 sentences)
-4. Cover different aspects of the text
-5. Base answers ONLY on the provided text
+4. Cover different aspects of each text
+5. Base answers ONLY on the provided text{avoid_section}
 
-OUTPUT: Return ONLY a valid JSON array with this structure:
-[
-  {{
-    "question": "What is the main topic?",
-    "answer": "The main topic is... [complete answer]"
-  }}
-]
+OUTPUT: One JSON object per text, with "chunk_id" matching the text's number and "faqs" holding its question-answer pairs."""
 
-CRITICAL: Return ONLY the JSON array, no markdown, no extra text."""
+_prefix_token_cache: Dict[str, int] = {}
+
+def _prompt_prefix_tokens(client, model_name: str) -> int:
+    """Token cost of the instruction prefix, counted once per model"""
+    if model_name not in _prefix_token_cache:
+        empty_prompt = _PROMPT_TEMPLATE.format(
+            k=1, num_questions=5, batch_num=1, total_batches=1,
+            sections='', avoid_section=''
+        )
+        _prefix_token_cache[model_name] = _count_tokens(client, empty_prompt, model_name)
+    return _prefix_token_cache[model_name]
+
+async def generate_faqs_batched(
+    client,
+    chunks_slice: List[str],
+    batch_num: int,
+    total_batches: int,
+    num_questions: int = 5,
+    model_name: str = "gemini-2.0-flash-exp",
+    avoid_questions: List[str] = None
+) -> Tuple[List[str], List[str]]:
+    """Generate FAQ pairs for a batch of chunks in one Gemini request
+
+    Returns parallel question/answer lists (SoA) so downstream dedup and
+    export loops avoid per-row dict allocation and lookup.
+    """
+
+    sections = "\n\n".join(
+        f"=== CHUNK {i} ===\n{chunk}" for i, chunk in enumerate(chunks_slice)
+    )
+
+    avoid_section = ""
+    if avoid_questions:
+        avoid_section = "\n\nAVOID duplicating these already-generated questions:\n" + \
+            "\n".join(f"- {q}" for q in avoid_questions)
+
+    prompt = _PROMPT_TEMPLATE.format(
+        k=len(chunks_slice),
+        num_questions=num_questions,
+        batch_num=batch_num,
+        total_batches=total_batches,
+        sections=sections,
+        avoid_section=avoid_section
+    )
 
     try:
-        response_text = generate_with_gemini(client, prompt, model_name)
-        
+        # Output cap scales with the requested pair count so JSON mode
+        # never truncates mid-array on large batches
+        output_budget = min(
+            MAX_OUTPUT_TOKENS,
+            len(chunks_slice) * num_questions * OUTPUT_TOKENS_PER_FAQ
+        )
+        response_text = await generate_with_gemini(client, prompt, model_name, output_budget)
+
         if not response_text:
-            return []
-        
-        # Clean response
-        response_text = response_text.strip()
-        
-        # Remove markdown code blocks
-        if '```json' in response_text:
-            response_text = response_text.split('```json')[1].split('```')[0]
-        elif '```' in response_text:
-            response_text = response_text.split('```')[1].split('```')[0]
-        
-        response_text = response_text.strip()
-        
-        # Parse JSON
-        faqs = json.loads(response_text)
-        
-        # Validate structure
-        if isinstance(faqs, list):
-            valid_faqs = []
-            for faq in faqs:
-                if isinstance(faq, dict) and 'question' in faq and 'answer' in faq:
-                    if faq['question'].strip() and faq['answer'].strip():
-                        valid_faqs.append({
-                            'question': faq['question'].strip(),
-                            'answer': faq['answer'].strip()
-                        })
-            return valid_faqs
-        
-        return []
-        
+            return [], []
+
+        # JSON mode makes the body directly parseable; keep the array
+        # extraction as a safety net for models that ignore the schema
+        try:
+            entries = _json_loads(response_text)
+        except json.JSONDecodeError:
+            m = _JSON_ARRAY_RE.search(response_text)
+            if not m:
+                raise
+            entries = _json_loads(m.group(0))
+
+        # Validate structure and flatten per-chunk results
+        if isinstance(entries, list):
+            questions = []
+            answers = []
+            for entry in entries:
+                if isinstance(entry, dict) and isinstance(entry.get('faqs'), list):
+                    entry_faqs = entry['faqs']
+                elif isinstance(entry, dict) and 'question' in entry:
+                    # Model occasionally returns a flat array of pairs
+                    entry_faqs = [entry]
+                else:
+                    continue
+
+                for faq in entry_faqs:
+                    if isinstance(faq, dict) and 'question' in faq and 'answer' in faq:
+                        if faq['question'].strip() and faq['answer'].strip():
+                            questions.append(faq['question'].strip())
+                            answers.append(faq['answer'].strip())
+            return questions, answers
+
+        return [], []
+
     except json.JSONDecodeError as e:
-        st.warning(f"⚠️ Chunk {chunk_num}: JSON parsing error")
-        return []
+        st.warning(f"⚠️ Batch {batch_num}: JSON parsing error")
+        return [], []
     except Exception as e:
-        st.error(f"❌ Chunk {chunk_num}: {str(e)[:100]}")
-        return []
+        st.error(f"❌ Batch {batch_num}: {str(e)[:100]}")
+        return [], []
 
-def deduplicate_faqs(faqs: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    """Remove duplicate FAQs"""
-    seen_questions = set()
-    unique_faqs = []
-    
-    for faq in faqs:
-        q_normalized = faq['question'].lower().strip().rstrip('?').rstrip('.')
-        if q_normalized not in seen_questions:
-            seen_questions.add(q_normalized)
-            unique_faqs.append(faq)
-    
-    return unique_faqs
+async def generate_all_faqs(
+    client,
+    chunks: List[str],
+    num_questions: int,
+    model_name: str,
+    progress_events: queue.Queue,
+    chunk_tokens: List[int] = None
+) -> List[Tuple[List[str], List[str]]]:
+    """Generate FAQs for all chunks concurrently in token-budgeted batches
+
+    Runs on the persistent background loop; Streamlit widgets cannot be
+    driven from there, so completion is reported as (done, total,
+    batch_idx, faq_count) tuples through the thread-safe progress_events
+    queue and rendered by the script thread.
+    """
+
+    batches = plan_chunk_batches(client, chunks, model_name, num_questions, chunk_tokens)
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    limiter = AsyncLimiter(REQUESTS_PER_MINUTE, 60)
+    result_queue: asyncio.Queue = asyncio.Queue()
+
+    # Normalized questions kept so far; grows as batches complete, so
+    # later prompts can steer away from topics already covered
+    seen_questions: List[str] = []
+
+    async def worker(i: int, batch: List[int]):
+        # The consumer below blocks on one queue item per worker, so the
+        # put must happen even if the request or limiter raises
+        batch_qa: Tuple[List[str], List[str]] = ([], [])
+        try:
+            async with semaphore, limiter:
+                batch_qa = await generate_faqs_batched(
+                    client, [chunks[j] for j in batch], i+1, len(batches),
+                    num_questions, model_name,
+                    avoid_questions=seen_questions[-AVOID_LIST_SIZE:]
+                )
+        finally:
+            await result_queue.put((i, batch_qa))
+
+    tasks = [asyncio.create_task(worker(i, batch)) for i, batch in enumerate(batches)]
+
+    results: List[Tuple[List[str], List[str]]] = [([], []) for _ in batches]
+
+    for done in range(len(batches)):
+        i, (questions, answers) = await result_queue.get()
+        questions, answers = deduplicate_faqs(questions, answers, seen_questions)
+        results[i] = (questions, answers)
+
+        progress_events.put((done + 1, len(batches), i, len(questions)))
+
+    await asyncio.gather(*tasks)
+
+    return results
+
+# Overlapping chunks produce rephrasings of the same question, so dedup
+# is fuzzy: token_set_ratio >= this score counts as a duplicate
+DUPLICATE_SCORE_CUTOFF = 85
+
+# How many recent question stems to feed back into later prompts
+AVOID_LIST_SIZE = 15
+
+# Deletes punctuation in one C-level pass; spaces stay so the
+# token-based fuzzy scorer still sees word boundaries
+_NORM_TABLE = str.maketrans('', '', '?.!,;')
+
+def deduplicate_faqs(
+    questions: List[str],
+    answers: List[str],
+    seen_questions: List[str] = None
+) -> Tuple[List[str], List[str]]:
+    """Remove duplicate and near-duplicate FAQs from parallel Q/A lists
+
+    Pass the same seen_questions list across calls to deduplicate batch
+    results online as they arrive.
+    """
+    if seen_questions is None:
+        seen_questions = []
+
+    q_norms = [q.lower().translate(_NORM_TABLE).strip() for q in questions]
+
+    unique_questions = []
+    unique_answers = []
+
+    for q, a, q_norm in zip(questions, answers, q_norms):
+        if fuzz is not None:
+            duplicate = bool(seen_questions) and rf_process.extractOne(
+                q_norm, seen_questions,
+                scorer=fuzz.token_set_ratio,
+                score_cutoff=DUPLICATE_SCORE_CUTOFF
+            ) is not None
+        else:
+            duplicate = q_norm in seen_questions
+
+        if not duplicate:
+            seen_questions.append(q_norm)
+            unique_questions.append(q)
+            unique_answers.append(a)
+
+    return unique_questions, unique_answers
 
 # ============================================================
 # EXPORT FUNCTIONS
 # ============================================================
 
-def export_to_json(faqs: List[Dict[str, str]], filename: str) -> str:
+@st.cache_data(show_spinner=False)
+def export_to_json(questions: List[str], answers: List[str], filename: str) -> str:
     """Export FAQs to JSON"""
     data = {
         "document": filename,
         "generated_at": datetime.now().isoformat(),
-        "total_faqs": len(faqs),
+        "total_faqs": len(questions),
         "model": "Google Gemini 2.0 Flash",
-        "faqs": faqs
+        "faqs": [{"question": q, "answer": a} for q, a in zip(questions, answers)]
     }
-    return json.dumps(data, indent=2, ensure_ascii=False)
+    return _json_dumps(data)
 
-def export_to_markdown(faqs: List[Dict[str, str]], filename: str) -> str:
+@st.cache_data(show_spinner=False)
+def export_to_markdown(questions: List[str], answers: List[str], filename: str) -> str:
     """Export FAQs to Markdown"""
-    md = f"# 📚 FAQs - {filename}\n\n"
-    md += f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}  \n"
-    md += f"**Total Questions:** {len(faqs)}  \n\n---\n\n"
-    
-    for i, faq in enumerate(faqs, 1):
-        md += f"## {i}. {faq['question']}\n\n"
-        md += f"**Answer:** {faq['answer']}\n\n---\n\n"
-    
-    return md
+    header = (
+        f"# 📚 FAQs - {filename}\n\n"
+        f"**Generated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}  \n"
+        f"**Total Questions:** {len(questions)}  \n\n---\n\n"
+    )
+    body = "".join(
+        f"## {i}. {q}\n\n**Answer:** {a}\n\n---\n\n"
+        for i, (q, a) in enumerate(zip(questions, answers), 1)
+    )
+    return header + body
 
-def export_to_html(faqs: List[Dict[str, str]], filename: str) -> str:
+@st.cache_data(show_spinner=False)
+def export_to_html(questions: List[str], answers: List[str], filename: str) -> str:
     """Export FAQs to HTML"""
-    html = f"""<!DOCTYPE html>
+    head = f"""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -388,24 +772,26 @@ def export_to_html(faqs: List[Dict[str, str]], filename: str) -> str:
     <div class="container">
         <h1>📚 {filename}</h1>
         <p style="text-align:center;color:#888;margin-bottom:30px;">
-            Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Total: {len(faqs)} FAQs
+            Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')} | Total: {len(questions)} FAQs
         </p>
 """
-    
-    for i, faq in enumerate(faqs, 1):
-        html += f"""
+
+    body = "".join(
+        f"""
         <div class="faq">
-            <div class="question">Q{i}: {faq['question']}</div>
-            <div class="answer">{faq['answer']}</div>
+            <div class="question">Q{i}: {q}</div>
+            <div class="answer">{a}</div>
         </div>
 """
-    
-    html += """
+        for i, (q, a) in enumerate(zip(questions, answers), 1)
+    )
+
+    foot = """
     </div>
 </body>
 </html>
 """
-    return html
+    return head + body + foot
 
 # ============================================================
 # MAIN APPLICATION
@@ -463,13 +849,13 @@ def main():
         st.markdown("---")
         st.subheader("📊 Settings")
         
-        chunk_size = st.slider("Chunk Size", 500, 3000, 2000, 100)
-        overlap = st.slider("Overlap", 0, 500, 200, 50)
+        chunk_size = st.slider("Chunk Size (tokens)", 500, 3000, 1500, 100)
+        overlap = st.slider("Overlap (tokens)", 0, 500, 200, 50)
         questions_per_chunk = st.slider("Questions/Chunk", 3, 8, 5)
         
-        if 'faqs' in st.session_state:
+        if 'questions' in st.session_state:
             st.markdown("---")
-            st.metric("Total FAQs", len(st.session_state.faqs))
+            st.metric("Total FAQs", len(st.session_state.questions))
             if st.button("🗑️ Clear"):
                 for k in list(st.session_state.keys()):
                     del st.session_state[k]
@@ -501,13 +887,7 @@ def main():
             
             # Extract text
             with st.spinner("Extracting text..."):
-                if uploaded_file.name.endswith('.pdf'):
-                    text = extract_text_from_pdf(uploaded_file)
-                else:
-                    text = extract_text_from_txt(uploaded_file)
-                
-                if text:
-                    text = clean_text(text)
+                text = extract_and_clean(uploaded_file.getvalue(), uploaded_file.name)
             
             if not text:
                 st.error("❌ No text extracted")
@@ -521,7 +901,7 @@ def main():
             
             # Chunk text
             with st.spinner("Chunking..."):
-                chunks = smart_chunk_text(text, chunk_size, overlap)
+                chunks, chunk_tokens = smart_chunk_text(text, chunk_size, overlap, client, model_name)
             
             st.markdown(f"""
             <div class="success-box">
@@ -532,87 +912,111 @@ def main():
             # Generate FAQs
             st.markdown("### 🤖 Generating FAQs...")
             
-            all_faqs = []
             progress_bar = st.progress(0)
             status = st.empty()
-            
-            for i, chunk in enumerate(chunks):
-                status.markdown(
-                    f"<p class='progress-text'>Processing chunk {i+1}/{len(chunks)}...</p>",
-                    unsafe_allow_html=True
-                )
-                
-                faqs = generate_faqs_from_chunk(
-                    client, chunk, i+1, len(chunks),
-                    questions_per_chunk, model_name
-                )
-                
-                if faqs:
-                    all_faqs.extend(faqs)
-                    st.toast(f"✅ Chunk {i+1}: {len(faqs)} FAQs", icon="✅")
-                
-                progress_bar.progress((i + 1) / len(chunks))
-                
-                if i < len(chunks) - 1:
-                    time.sleep(1)
-            
+
+            loop, loop_thread = _get_async_loop()
+            # Let st.warning/st.error inside workers reach this session
+            add_script_run_ctx(loop_thread, get_script_run_ctx())
+
+            progress_events: queue.Queue = queue.Queue()
+            future = asyncio.run_coroutine_threadsafe(
+                generate_all_faqs(
+                    client, chunks, questions_per_chunk,
+                    model_name, progress_events, chunk_tokens
+                ),
+                loop
+            )
+
+            # Render progress on the script thread while the background
+            # loop works; drains remaining events before finishing
+            while True:
+                try:
+                    done, total, batch_idx, n_faqs = progress_events.get(timeout=0.5)
+                except queue.Empty:
+                    if future.done():
+                        break
+                    continue
+
+                step = max(1, total // 50)
+                if done % step == 0 or done == total:
+                    status.markdown(
+                        f"<p class='progress-text'>Completed {done}/{total} batches...</p>",
+                        unsafe_allow_html=True
+                    )
+                    progress_bar.progress(done / total)
+
+                if n_faqs:
+                    st.toast(f"✅ Batch {batch_idx+1}: {n_faqs} FAQs", icon="✅")
+
+            results = future.result()
+
+            all_questions = []
+            all_answers = []
+            for questions, answers in results:
+                all_questions.extend(questions)
+                all_answers.extend(answers)
+
             status.empty()
             progress_bar.empty()
-            
-            if all_faqs:
-                all_faqs = deduplicate_faqs(all_faqs)
-                
+
+            if all_questions:
                 st.markdown(f"""
                 <div class="success-box">
-                    🎉 Generated {len(all_faqs)} unique FAQs!
+                    🎉 Generated {len(all_questions)} unique FAQs!
                 </div>
                 """, unsafe_allow_html=True)
-                
-                st.session_state.faqs = all_faqs
+
+                st.session_state.questions = all_questions
+                st.session_state.answers = all_answers
                 st.session_state.doc_name = uploaded_file.name
                 st.balloons()
             else:
                 st.error("❌ No FAQs generated")
     
     # Display results
-    if 'faqs' in st.session_state and st.session_state.faqs:
+    if 'questions' in st.session_state and st.session_state.questions:
         st.markdown("---")
-        st.header(f"📋 Results ({len(st.session_state.faqs)} FAQs)")
-        
+        st.header(f"📋 Results ({len(st.session_state.questions)} FAQs)")
+
         # Export buttons
         col1, col2, col3 = st.columns(3)
-        
+
         with col1:
             st.download_button(
                 "📄 JSON",
-                export_to_json(st.session_state.faqs, st.session_state.doc_name),
+                export_to_json(st.session_state.questions, st.session_state.answers,
+                               st.session_state.doc_name),
                 f"{st.session_state.doc_name}_faqs.json",
                 use_container_width=True
             )
-        
+
         with col2:
             st.download_button(
                 "📝 Markdown",
-                export_to_markdown(st.session_state.faqs, st.session_state.doc_name),
+                export_to_markdown(st.session_state.questions, st.session_state.answers,
+                                   st.session_state.doc_name),
                 f"{st.session_state.doc_name}_faqs.md",
                 use_container_width=True
             )
-        
+
         with col3:
             st.download_button(
                 "🌐 HTML",
-                export_to_html(st.session_state.faqs, st.session_state.doc_name),
+                export_to_html(st.session_state.questions, st.session_state.answers,
+                               st.session_state.doc_name),
                 f"{st.session_state.doc_name}_faqs.html",
                 use_container_width=True
             )
-        
+
         # Preview
         st.markdown("---")
         st.subheader("📖 Preview")
-        
-        for i, faq in enumerate(st.session_state.faqs, 1):
-            with st.expander(f"**Q{i}: {faq['question']}**"):
-                st.markdown(f"**Answer:** {faq['answer']}")
+
+        for i, (q, a) in enumerate(zip(st.session_state.questions,
+                                       st.session_state.answers), 1):
+            with st.expander(f"**Q{i}: {q}**"):
+                st.markdown(f"**Answer:** {a}")
     
     elif not api_key:
         st.info("👈 Enter your Gemini API key to start!")